@@ -1,40 +1,46 @@
 #!/usr/bin/env python3
 
 import os
-import json as js
-import pathlib as pl
+import asyncio as aio
 
 import lib.bash_tool as bt
 import lib.llm_helpers as lh
+import lib.agent_common as ac
 
+try:
+    import prompt_toolkit as ptk
+    import prompt_toolkit.history as pth
+    import prompt_toolkit.completion as ptc
+except ImportError:
+    ptk = None
 
-#################### System Prompt ####################
 
-SYSTEM_PROMPT = f"""You are a helpful Bash assistant with the ability to execute commands in the shell.
-You engage with users to help answer questions about bash commands, or execute their intent.
-If user intent is unclear, keep engaging with them to figure out what they need and how to best help
-them. If they ask question that are not relevant to bash or computer use, decline to answer.
+HISTORY_FILE = os.path.join(ac.HOME_DIR, ".agent_history")
 
-When a command is executed, you will be given the output from that command and any errors. Based on
-that, either take further actions or yield control to the user.
 
-The bash interpreter's output and current working directory will be given to you every time a
-command is executed. Take that into account for the next conversation.
-If there was an error during execution, tell the user what that error was exactly.
+#################### System Prompt ####################
 
-You are only allowed to execute the following commands:
-{', '.join(bt.LIST_OF_ALLOWED_COMMANDS)}
+SYSTEM_PROMPT = ac.make_system_prompt(bt.LIST_OF_ALLOWED_COMMANDS)
 
-**Never** attempt to execute a command not in this list. **Never** attempt to execute dangerous commands
-like `rm`, `mv`, `rmdir`, `sudo`, etc. If the user asks you to do so, politely refuse.
 
-When you switch to new directories, always list files so you can get more context.
-"""
+#################### Helper Functions ####################
 
+def make_prompt_reader():
+    """
 
-#################### Helper Functions ####################
+    Return an awaitable line reader, with history and command completion when prompt_toolkit is installed
+    """
+    if ptk is None:
+        return ac.read_input
 
-def confirm_execution(cmd, is_auto):
+    session = ptk.PromptSession(
+        history=pth.FileHistory(HISTORY_FILE),
+        completer=ptc.WordCompleter(bt.LIST_OF_ALLOWED_COMMANDS)
+    )
+    return session.prompt_async
+
+
+async def confirm_execution(cmd, is_auto):
     """
 
     Ask the user whether the suggested command should be executed
@@ -43,16 +49,58 @@ def confirm_execution(cmd, is_auto):
         print(f"    ⚡  Auto-executing '{cmd}'")
         return True
 
-    response = input(f"    ▶️   Execute '{cmd}'? [y/N]: ").strip().lower()
-    return response == "y"
+    response = await ac.read_input(f"    ▶️   Execute '{cmd}'? [y/N]: ")
+    return response.strip().lower() == "y"
+
+
+def parse_tool_call(tc):
+    """
+
+    Extract the bash command from a tool call, or an error result if it is malformed
+    """
+    try:
+        function_args = lh.loads(tc.function.arguments)
+    except ValueError:
+        return None, {"error": "Failed to parse function arguments"}
 
+    if tc.function.name != "exec_bash_command" or "cmd" not in function_args:
+        return None, {"error": "Incorrect tool or function argument"}
 
-def get_prompt_prefix(cwd):
+    return function_args["cmd"], None
+
+
+async def run_tool_calls(bash, pool, tool_calls):
     """
 
-    Generate a prompt prefix showing the current working directory
+    Execute a turn's tool calls in order, running consecutive auto-executable ones in parallel
     """
-    return f"['{cwd}' 🙂] "
+    results = [None] * len(tool_calls)
+    batch   = []
+
+    async def flush_batch():
+        if batch:
+            batch_results = await aio.to_thread(pool.run_all, [cmd for _, cmd in batch])
+            for (i, _), result in zip(batch, batch_results):
+                results[i] = result
+            batch.clear()
+
+    for i, tc in enumerate(tool_calls):
+        cmd, error = parse_tool_call(tc)
+
+        if error:
+            results[i] = error
+        elif bash.is_parallel_safe(cmd):
+            await confirm_execution(cmd, True)
+            batch.append((i, cmd))
+        else:
+            await flush_batch()
+            if await confirm_execution(cmd, bash.is_auto_executable(cmd)):
+                results[i] = await aio.to_thread(bash.exec_bash_command, cmd)
+            else:
+                results[i] = {"error": "The user declined the execution of this command"}
+
+    await flush_batch()
+    return results
 
 
 def get_backend_config():
@@ -127,7 +175,7 @@ def print_banner(model, base_url, start_dir, auto_count, allowed_count):
 
 #################### Main Entry Point ####################
 
-def main():
+async def main():
     """
 
     Main entry point for the bash agent
@@ -141,15 +189,18 @@ def main():
         print("Exiting...")
         return
 
-    start_dir = str(pl.Path.home())
+    start_dir = ac.HOME_DIR
 
     bash     = bt.Bash(
         cwd=start_dir,
         allowed_commands=bt.LIST_OF_ALLOWED_COMMANDS,
         auto_execute_commands=bt.LIST_OF_AUTO_EXECUTE_COMMANDS
     )
+    pool     = bt.BashPool(bash)
     llm      = lh.LLM(base_url=base_url, api_key=api_key, model=model)
     messages = lh.Messages(SYSTEM_PROMPT)
+    tools    = [bash.to_json_schema()]
+    prompt   = make_prompt_reader()
 
     print_banner(
         model,
@@ -159,60 +210,45 @@ def main():
         len(bt.LIST_OF_ALLOWED_COMMANDS)
     )
 
-    while True:
-        try:
-            user_input = input(get_prompt_prefix(bash.cwd)).strip()
+    try:
+        while True:
+            try:
+                user_input = (await prompt(ac.get_prompt_prefix(bash.cwd))).strip()
 
-            if user_input.lower() in ['exit', 'quit', 'q']:
-                print("\n👋 Goodbye!")
-                break
-
-            if not user_input:
-                continue
+                if user_input.lower() in ['exit', 'quit', 'q']:
+                    print("\n👋 Goodbye!")
+                    break
 
-            messages.add_user_message(user_input)
+                if not user_input:
+                    continue
 
-            while True:
-                response, tool_calls = llm.query(messages, [bash.to_json_schema()])
-                messages.add_assistant_message(response, tool_calls)
+                messages.add_user_message(user_input)
 
-                if tool_calls:
-                    for tc in tool_calls:
-                        function_name = tc.function.name
+                while True:
+                    response, tool_calls = await llm.aquery(messages, tools)
+                    messages.add_assistant_message(response, tool_calls)
 
-                        try:
-                            function_args = js.loads(tc.function.arguments)
-                        except js.JSONDecodeError:
-                            tool_call_result = {"error": "Failed to parse function arguments"}
+                    if tool_calls:
+                        results = await run_tool_calls(bash, pool, tool_calls)
+                        for tc, tool_call_result in zip(tool_calls, results):
                             messages.add_tool_message(tool_call_result, tc.id)
-                            continue
-
-                        if function_name != "exec_bash_command" or "cmd" not in function_args:
-                            tool_call_result = {"error": "Incorrect tool or function argument"}
-                        else:
-                            cmd     = function_args["cmd"]
-                            is_auto = bash.is_auto_executable(cmd)
-
-                            if confirm_execution(cmd, is_auto):
-                                tool_call_result = bash.exec_bash_command(cmd)
-                            else:
-                                tool_call_result = {"error": "The user declined the execution of this command"}
-
-                        messages.add_tool_message(tool_call_result, tc.id)
-                else:
-                    clean_response = llm.strip_thinking(response)
-                    if clean_response:
-                        print(f"\n[🤖] {clean_response}")
-                    print()
-                    break
+                    else:
+                        print()
+                        break
 
-        except KeyboardInterrupt:
-            print("\n\n👋 Session interrupted. Goodbye!")
-            break
-        except Exception as e:
-            print(f"\n❌ Error: {e}")
-            print("   Please try again\n")
+            except (KeyboardInterrupt, aio.CancelledError):
+                print("\n\n👋 Session interrupted. Goodbye!")
+                break
+            except Exception as e:
+                print(f"\n❌ Error: {e}")
+                print("   Please try again\n")
+    finally:
+        pool.close()
+        bash.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        aio.run(main())
+    except KeyboardInterrupt:
+        pass
\ No newline at end of file
@@ -0,0 +1,118 @@
+import os
+import asyncio as aio
+import threading as th
+
+
+HOME_DIR = os.path.realpath(os.path.expanduser("~"))
+
+
+#################### System Prompt ####################
+
+SYSTEM_PROMPT_TEMPLATE = """You are a helpful Bash assistant with the ability to execute commands in the shell.
+You engage with users to help answer questions about bash commands, or execute their intent.
+If user intent is unclear, keep engaging with them to figure out what they need and how to best help
+them. If they ask question that are not relevant to bash or computer use, decline to answer.
+
+When a command is executed, you will be given the output from that command and any errors. Based on
+that, either take further actions or yield control to the user.
+
+The bash interpreter's output and current working directory will be given to you every time a
+command is executed. Take that into account for the next conversation.
+If there was an error during execution, tell the user what that error was exactly.
+
+You are only allowed to execute the following commands:
+{allowed_commands}
+
+**Never** attempt to execute a command not in this list. **Never** attempt to execute dangerous commands
+like `rm`, `mv`, `rmdir`, `sudo`, etc. If the user asks you to do so, politely refuse.
+
+When you switch to new directories, always list files so you can get more context.
+"""
+
+
+def make_system_prompt(allowed_commands, think=False):
+    """
+
+    Fill the system prompt with the sorted allowlist, optionally enabling reasoning mode
+    """
+    prompt = SYSTEM_PROMPT_TEMPLATE.format(allowed_commands=", ".join(sorted(allowed_commands)))
+    return f"/think\n{prompt}" if think else prompt
+
+
+#################### Execution Wrapper Class ####################
+
+class ExecOnConfirm:
+    """
+
+    A wrapper around Bash class to implement human-in-the-loop confirmation
+    """
+
+    def __init__(self, bash):
+        self.bash = bash
+
+    def _confirm_execution(self, cmd):
+        """
+
+        Ask the user whether the suggested command should be executed
+        """
+        if self.bash.is_auto_executable(cmd):
+            print(f"    ⚡  Auto-executing '{cmd}'")
+            return True
+
+        return input(f"    ▶️   Execute '{cmd}'? [y/N]: ").strip().lower() == "y"
+
+    def exec_bash_command(self, cmd):
+        """
+
+        Execute a bash command after confirming with the user
+        """
+        if self._confirm_execution(cmd):
+            return self.bash.exec_bash_command(cmd)
+        return {"error": "The user declined the execution of this command"}
+
+
+#################### Helper Functions ####################
+
+def read_input(prompt):
+    """
+
+    Read a line on a daemon thread so the event loop keeps running and Ctrl-C is not stuck behind input()
+    """
+    loop   = aio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(setter, value):
+        if not future.done():
+            setter(value)
+
+    def reader():
+        try:
+            line = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(settle, future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(settle, future.set_result, line)
+
+    th.Thread(target=reader, daemon=True).start()
+    return future
+
+
+PREFIX_CACHE_SIZE = 64
+
+_prefix_cache = {}
+
+
+def get_prompt_prefix(cwd):
+    """
+
+    Generate a prompt prefix showing the current working directory, cached per cwd
+    """
+    prefix = _prefix_cache.get(cwd)
+
+    if prefix is None:
+        prefix = f"['{cwd}' 🙂] "
+        if len(_prefix_cache) >= PREFIX_CACHE_SIZE:
+            _prefix_cache.clear()
+        _prefix_cache[cwd] = prefix
+
+    return prefix
@@ -1,5 +1,13 @@
-import subprocess as sp
+import os
 import re
+import time
+import uuid
+import shlex
+import signal
+import functools as ft
+import threading as th
+import subprocess as sp
+import concurrent.futures as cf
 
 
 #################### Command Lists ####################
@@ -21,24 +29,144 @@ LIST_OF_AUTO_EXECUTE_COMMANDS = [
     "df", "free", "ps",
     "which", "whereis", "file", "stat", "basename", "dirname",
     "echo", "cat", "head", "tail", "wc",
-    "tree", "find",
-    "ls", "cd", 
+    "tree", "find", "cd",
     "wget",
 ]
 
+LIST_OF_WRITING_COMMANDS = [
+    "touch", "mkdir", "cp",
+    "wget", "curl",
+    "tar", "zip", "unzip", "gzip", "gunzip",
+]
+
+
+#################### Tool Schema ####################
+
+TOOL_SCHEMA = {
+    "type": "function",
+    "function": {
+        "name": "exec_bash_command",
+        "description": "Execute a bash command and return stdout/stderr and the working directory",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "cmd": {
+                    "type": "string",
+                    "description": "The bash command to execute"
+                }
+            },
+            "required": ["cmd"],
+        },
+    },
+}
+
+
+#################### Command Parsing Patterns ####################
+
+_SEP_RE   = re.compile(r'\|\||&&|\$\(|[|;&`\n]')
+_REDIR_RE = re.compile(r'>+\s*\S+')
+
+_SERIAL_COMMANDS = frozenset(LIST_OF_WRITING_COMMANDS) | {"cd"}
+
+
+#################### Coprocess Helpers ####################
+
+DEFAULT_TIMEOUT   = 120
+OUTPUT_HEAD_BYTES = 32 * 1024
+OUTPUT_TAIL_BYTES = 8 * 1024
+_READ_SIZE        = 1 << 16
+
+
+class _PipeBuffer:
+    """
+
+    Drains a coprocess pipe into one contiguous bytearray and lets callers wait for a marker in it.
+    Output beyond a head and tail window is discarded as it arrives, so huge outputs are
+    never held in memory or decoded in full.
+    """
+
+    def __init__(self, fd):
+        self._buf     = bytearray()
+        self._dropped = 0
+        self._eof     = False
+        self._cond    = th.Condition()
+        th.Thread(target=self._pump, args=(fd,), daemon=True).start()
+
+    def _pump(self, fd):
+        """
+
+        Append raw reads from the pipe until EOF, trimming the middle and waking any waiting reader
+        """
+        while True:
+            chunk = os.read(fd, _READ_SIZE)
+            with self._cond:
+                if chunk:
+                    self._buf += chunk
+                    if len(self._buf) > OUTPUT_HEAD_BYTES + OUTPUT_TAIL_BYTES + _READ_SIZE:
+                        cut_end        = len(self._buf) - OUTPUT_TAIL_BYTES
+                        self._dropped += cut_end - OUTPUT_HEAD_BYTES
+                        del self._buf[OUTPUT_HEAD_BYTES:cut_end]
+                else:
+                    self._eof = True
+                self._cond.notify()
+            if not chunk:
+                return
+
+    def read_until(self, marker, deadline):
+        """
+
+        Consume the buffer through the next marker line, returning the bytes before the
+        marker and the marker line's payload, or None if the deadline passes first
+        """
+        with self._cond:
+            while True:
+                # The buffer is bounded by the head/tail trim, so a full rescan per wake-up stays cheap
+                idx = self._buf.find(marker)
+                end = self._buf.find(b"\n", idx + len(marker)) if idx != -1 else -1
+
+                if end != -1:
+                    return self._consume(idx, len(marker), end)
+
+                if self._eof:
+                    raise RuntimeError("The bash process exited unexpectedly")
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def _consume(self, idx, marker_len, end):
+        """
+
+        Pop the output before the marker and the marker line's payload, noting any dropped middle
+        """
+        output  = bytes(self._buf[:idx])
+        payload = bytes(self._buf[idx + marker_len:end])
+
+        if self._dropped or len(output) > OUTPUT_HEAD_BYTES + OUTPUT_TAIL_BYTES:
+            dropped       = self._dropped + max(len(output) - OUTPUT_HEAD_BYTES - OUTPUT_TAIL_BYTES, 0)
+            note          = f"\n…[{dropped} bytes truncated]…\n".encode()
+            output        = output[:OUTPUT_HEAD_BYTES] + note + output[-OUTPUT_TAIL_BYTES:]
+            self._dropped = 0
+
+        del self._buf[:end + 1]
+        return output, payload
+
 
 #################### Bash Tool Class ####################
 
 class Bash:
     """
 
-    Executes Bash commands with allowlist enforcement and directory tracking
+    Executes Bash commands in a persistent shell with allowlist enforcement and directory tracking
     """
 
-    def __init__(self, cwd, allowed_commands, auto_execute_commands=None):
-        self.cwd                   = cwd
-        self._allowed_commands     = allowed_commands
-        self._auto_execute_commands = auto_execute_commands or []
+    def __init__(self, cwd, allowed_commands, auto_execute_commands=None, timeout=DEFAULT_TIMEOUT):
+        self.cwd                    = cwd
+        self.timeout                = timeout
+        self._allowed_commands      = frozenset(allowed_commands)
+        self._auto_execute_commands = frozenset(auto_execute_commands or ())
+        self._start_shell()
 
     def exec_bash_command(self, cmd):
         """
@@ -48,95 +176,217 @@ class Bash:
         if not cmd:
             return {"error": "No command was provided"}
 
-        for cmd_part in self._extract_commands(cmd):
-            if cmd_part not in self._allowed_commands:
-                return {"error": "Parts of this command were not in the allowlist"}
+        commands = self._extract_commands(cmd)
+
+        if not commands.issubset(self._allowed_commands):
+            return {"error": "Parts of this command were not in the allowlist"}
 
-        return self._run_bash_command(cmd)
+        return self._run_bash_command(cmd, track_cwd="cd" in commands)
 
     def is_auto_executable(self, cmd):
         """
 
-        Check if all commands in the string are auto-executable
+        Check if all commands in the string are auto-executable, reusing the memoized parse
+        that exec_bash_command's allowlist check will hit next
+        """
+        return self._extract_commands(cmd).issubset(self._auto_execute_commands)
+
+    def is_parallel_safe(self, cmd):
+        """
+
+        Check if the command can run alongside others: auto-executable, with no output
+        redirection and no command that writes files or changes the cwd
         """
+        if ">" in cmd:
+            return False
+
         commands = self._extract_commands(cmd)
-        return all(c in self._auto_execute_commands for c in commands)
+        return commands.isdisjoint(_SERIAL_COMMANDS) and commands.issubset(self._auto_execute_commands)
 
     def to_json_schema(self):
         """
 
-        Convert the function signature to a JSON schema for LLM tool calling
-        """
-        return {
-            "type": "function",
-            "function": {
-                "name": "exec_bash_command",
-                "description": "Execute a bash command and return stdout/stderr and the working directory",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "cmd": {
-                            "type": "string",
-                            "description": "The bash command to execute"
-                        }
-                    },
-                    "required": ["cmd"],
-                },
-            },
-        }
+        Return the JSON schema describing this tool for LLM tool calling
+        """
+        return TOOL_SCHEMA
+
+    @staticmethod
+    @ft.lru_cache(maxsize=128)
+    def _extract_commands(cmd):
+        """
 
-    def _extract_commands(self, cmd):
+        Extract the set of command names from a bash command string, memoized since
+        the same command is checked for auto-execution and then for the allowlist
         """
+        return frozenset(Bash._iter_commands(cmd))
 
-        Extract command names from a bash command string
+    @staticmethod
+    def _iter_commands(cmd):
         """
-        separators = r'[|;&]|\$\(|`|\|\||&&'
-        parts      = re.split(separators, cmd)
-        commands   = []
 
-        for part in parts:
-            part = part.strip()
+        Lazily yield the command names in a bash command string
+        """
+        for part in _SEP_RE.split(cmd):
+            part = _REDIR_RE.sub('', part).strip()
             if part:
-                part = re.sub(r'>+\s*\S+', '', part).strip()
-                if part:
-                    cmd_name = part.split()[0] if part.split() else ''
-                    if cmd_name:
-                        commands.append(cmd_name)
+                yield part.split(None, 1)[0]
+
+    def _start_shell(self):
+        """
 
-        return commands
+        Launch the long-lived bash coprocess and the threads draining its output
+        """
+        self._proc     = sp.Popen(
+            ["/bin/bash"],
+            stdin=sp.PIPE,
+            stdout=sp.PIPE,
+            stderr=sp.PIPE,
+            cwd=self.cwd,
+            start_new_session=True
+        )
+        self._stdout   = _PipeBuffer(self._proc.stdout.fileno())
+        self._stderr   = _PipeBuffer(self._proc.stderr.fileno())
 
-    def _run_bash_command(self, cmd):
+    def _restart_shell(self):
         """
 
-        Runs the bash command and catches exceptions
+        Kill the coprocess along with anything it spawned, then start a fresh one
+        """
+        self.close()
+        self._start_shell()
+
+    def close(self):
+        """
+
+        Kill the coprocess along with anything it spawned
+        """
+        try:
+            os.killpg(self._proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+        self._proc.wait()
+
+    def _read_until(self, pipe, marker, deadline):
+        """
+
+        Read a pipe through the marker line, raising if the command outlives its timeout
+        """
+        result = pipe.read_until(marker, deadline)
+
+        if result is None:
+            raise TimeoutError(f"Command timed out after {self.timeout} seconds")
+
+        return result
+
+    def _run_bash_command(self, cmd, track_cwd=True):
+        """
+
+        Runs the bash command in the coprocess and catches exceptions, only
+        reporting the working directory back when the command can change it
         """
         stdout  = ""
         stderr  = ""
         new_cwd = self.cwd
 
         try:
-            wrapped = f"{cmd};echo __END__;pwd"
-            result  = sp.run(
-                wrapped,
-                shell=True,
-                cwd=self.cwd,
-                capture_output=True,
-                text=True,
-                executable="/bin/bash"
+            if self._proc.poll() is not None:
+                self._start_shell()
+
+            nonce    = uuid.uuid4().hex
+            end_mark = f"__END_{nonce}__"
+            err_mark = f"__ERR_{nonce}__"
+            cwd_arg  = ' "$PWD"' if track_cwd else ''
+            script   = (
+                f"eval {shlex.quote(cmd)} < /dev/null\n"
+                f"printf '\\n{end_mark}%s\\n'{cwd_arg}\n"
+                f"printf '\\n{err_mark}\\n' >&2\n"
             )
 
-            stderr = result.stderr
-            split  = result.stdout.split("__END__")
-            stdout = split[0].strip()
+            self._proc.stdin.write(script.encode())
+            self._proc.stdin.flush()
+
+            deadline         = time.monotonic() + self.timeout
+            out_raw, cwd_raw = self._read_until(self._stdout, f"\n{end_mark}".encode(), deadline)
+            err_raw, _       = self._read_until(self._stderr, f"\n{err_mark}".encode(), deadline)
+
+            stdout = out_raw.decode(errors="replace").strip()
+            stderr = err_raw.decode(errors="replace")
 
             if not stdout and not stderr:
                 stdout = "Command executed successfully, without any output"
 
-            new_cwd  = split[-1].strip()
-            self.cwd = new_cwd
+            if track_cwd:
+                new_cwd  = cwd_raw.decode(errors="replace").strip()
+                self.cwd = new_cwd
 
         except Exception as e:
             stdout = ""
             stderr = str(e)
+            self._restart_shell()
+
+        return {"stdout": stdout, "stderr": stderr, "cwd": new_cwd}
+
 
-        return {"stdout": stdout, "stderr": stderr, "cwd": new_cwd}
\ No newline at end of file
+#################### Bash Pool Class ####################
+
+class BashPool:
+    """
+
+    Runs independent commands side by side on the primary Bash plus lazily spawned worker shells
+    """
+
+    def __init__(self, bash, size=4):
+        self._bash    = bash
+        self._size    = size
+        self._workers = []
+
+    def run_all(self, cmds):
+        """
+
+        Execute commands concurrently in the primary shell's cwd, returning results in order
+        """
+        if len(cmds) == 1:
+            return [self._bash.exec_bash_command(cmds[0])]
+
+        shells  = self._checkout(len(cmds))
+        results = [None] * len(cmds)
+
+        def drain(w):
+            for i in range(w, len(cmds), len(shells)):
+                results[i] = shells[w].exec_bash_command(cmds[i])
+
+        with cf.ThreadPoolExecutor(max_workers=len(shells)) as ex:
+            list(ex.map(drain, range(len(shells))))
+
+        return results
+
+    def _checkout(self, count):
+        """
+
+        Return up to count shells, all moved into the primary shell's cwd
+        """
+        extra = min(count, self._size) - 1
+
+        while len(self._workers) < extra:
+            self._workers.append(Bash(
+                cwd=self._bash.cwd,
+                allowed_commands=self._bash._allowed_commands,
+                auto_execute_commands=self._bash._auto_execute_commands,
+                timeout=self._bash.timeout
+            ))
+
+        for worker in self._workers[:extra]:
+            if worker.cwd != self._bash.cwd:
+                worker._run_bash_command(f"cd {shlex.quote(self._bash.cwd)}")
+
+        return [self._bash] + self._workers[:extra]
+
+    def close(self):
+        """
+
+        Shut down the worker shells, leaving the primary Bash to its owner
+        """
+        for worker in self._workers:
+            worker.close()
+        self._workers.clear()
@@ -1,6 +1,20 @@
+import re
+import sys
+import time
 import json as js
+import hashlib as hl
+import asyncio as aio
+import collections as cl
+import importlib.util as ilu
+
+import httpx as hx
 import openai as oai
 
+try:
+    import orjson as oj
+except ImportError:
+    oj = None
+
 
 #################### Default Model Configuration ####################
 
@@ -8,6 +22,53 @@ DEFAULT_BASE_URL = "http://localhost:8000/v1"
 DEFAULT_MODEL    = "nvidia/Llama-3.1-Nemotron-Nano-8B-v1"
 
 
+#################### HTTP Connection Settings ####################
+
+HTTP2_AVAILABLE  = ilu.find_spec("h2") is not None
+KEEPALIVE_EXPIRY = 300.0
+MAX_KEEPALIVE    = 32
+REQUEST_TIMEOUT  = 60.0
+CONNECT_TIMEOUT  = 5.0
+
+
+def http_client_options():
+    """
+
+    Connection pool settings shared by the sync and async HTTP clients
+    """
+    return {
+        "http2":   HTTP2_AVAILABLE,
+        "limits":  hx.Limits(max_keepalive_connections=MAX_KEEPALIVE, keepalive_expiry=KEEPALIVE_EXPIRY),
+        "timeout": hx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+    }
+
+
+_HTTP_CLIENT       = None
+_ASYNC_HTTP_CLIENT = None
+
+
+def _get_http_client():
+    """
+
+    Return the process-wide sync HTTP client, so every LLM shares one connection pool
+    """
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        _HTTP_CLIENT = hx.Client(**http_client_options())
+    return _HTTP_CLIENT
+
+
+def _get_async_http_client():
+    """
+
+    Return the process-wide async HTTP client, so every LLM shares one connection pool
+    """
+    global _ASYNC_HTTP_CLIENT
+    if _ASYNC_HTTP_CLIENT is None:
+        _ASYNC_HTTP_CLIENT = hx.AsyncClient(**http_client_options())
+    return _ASYNC_HTTP_CLIENT
+
+
 #################### Inference Backend Options ####################
 
 BACKENDS = {
@@ -29,113 +90,737 @@ BACKENDS = {
 }
 
 
+#################### JSON Helpers ####################
+
+def dumps(obj, sort_keys=False):
+    """
+
+    Serialize an object to a JSON string, using orjson when available
+    """
+    if oj:
+        return oj.dumps(obj, option=oj.OPT_SORT_KEYS if sort_keys else None).decode()
+    return js.dumps(obj, sort_keys=sort_keys)
+
+
+def dumps_bytes(obj):
+    """
+
+    Serialize an object to UTF-8 JSON bytes, skipping orjson's decode step
+    """
+    return oj.dumps(obj) if oj else js.dumps(obj).encode()
+
+
+def loads(text):
+    """
+
+    Parse a JSON string, using orjson when available
+    """
+    return oj.loads(text) if oj else js.loads(text)
+
+
+#################### Streamed Tool Calls ####################
+
+THINK_START = "<think>"
+THINK_END   = "</think>"
+
+# Models whose chat template opens the think block itself, so replies carry only a bare </think>
+THINK_PREOPENED_MODELS = frozenset({
+    "nvidia/nvidia-nemotron-nano-9b-v2",
+})
+
+Function = cl.namedtuple("Function", ["name", "arguments"])
+ToolCall = cl.namedtuple("ToolCall", ["id", "function"])
+
+
+#################### Think Filter Class ####################
+
+class ThinkFilter:
+    """
+
+    Incrementally hides <think>...</think> blocks from a stream of text chunks. Some chat
+    templates open the block themselves, so the model only emits a bare </think>; by default
+    (starts_in_think=None) text is therefore held until a tag settles which case applies, and
+    flush returns it if none ever does. starts_in_think=True hides text until the first
+    </think>, and False streams right away, hiding only explicit <think> blocks.
+    """
+
+    def __init__(self, starts_in_think=None):
+        self._pending    = ""
+        self._in_think   = bool(starts_in_think)
+        self._held       = None if starts_in_think is False else []
+        self._strip_lead = True
+
+    def feed(self, text):
+        """
+
+        Consume a chunk and return the part of it that is safe to display
+        """
+        self._pending += text
+        visible        = []
+
+        while self._pending:
+            if self._strip_lead:
+                self._pending = self._pending.lstrip()
+                if not self._pending:
+                    break
+                self._strip_lead = False
+
+            if self._held is not None:
+                if not self._settle(visible):
+                    break
+                continue
+
+            tag = THINK_END if self._in_think else THINK_START
+            idx = self._pending.find(tag)
+
+            if idx == -1:
+                keep = self._partial_tag_len(self._pending, tag)
+                if not self._in_think:
+                    visible.append(self._pending[:len(self._pending) - keep])
+                self._pending = self._pending[len(self._pending) - keep:] if keep else ""
+                break
+
+            if not self._in_think:
+                visible.append(self._pending[:idx])
+
+            self._pending    = self._pending[idx + len(tag):]
+            self._in_think   = not self._in_think
+            self._strip_lead = not self._in_think
+
+        return "".join(visible)
+
+    def _settle(self, visible):
+        """
+
+        Hold text until a tag shows whether it is reasoning: a bare </think> discards it, an
+        opening <think> releases it as a normal reply. Returns False if more input is needed.
+        """
+        end   = self._pending.find(THINK_END)
+        start = -1 if self._in_think else self._pending.find(THINK_START)
+
+        if start != -1 and (end == -1 or start < end):
+            visible.append("".join(self._held) + self._pending[:start])
+            self._held, self._in_think = None, True
+            self._pending              = self._pending[start + len(THINK_START):]
+            return True
+
+        if end != -1:
+            self._held, self._in_think = None, False
+            self._pending              = self._pending[end + len(THINK_END):]
+            self._strip_lead           = True
+            return True
+
+        keep = self._partial_tag_len(self._pending, THINK_END)
+        if not self._in_think:
+            keep = max(keep, self._partial_tag_len(self._pending, THINK_START))
+
+        self._held.append(self._pending[:len(self._pending) - keep])
+        self._pending = self._pending[len(self._pending) - keep:] if keep else ""
+        return False
+
+    def flush(self):
+        """
+
+        Return any held-back text once the stream has ended
+        """
+        rest, self._pending = self._pending, ""
+
+        if self._held is not None:
+            return "".join(self._held) + rest
+        return "" if self._in_think else rest
+
+    def _partial_tag_len(self, text, tag):
+        """
+
+        Length of the longest suffix of text that is a prefix of tag
+        """
+        for size in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+
+
+#################### Stream Echo Class ####################
+
+FLUSH_EVERY    = 32
+FLUSH_INTERVAL = 0.05
+
+
+class StreamEcho:
+    """
+
+    Echoes streamed text to stdout behind a prefix, flushing in batches rather than per token
+    """
+
+    def __init__(self, prefix, flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL):
+        self._prefix         = prefix
+        self._flush_every    = flush_every
+        self._flush_interval = flush_interval
+        self._write          = sys.stdout.write
+        self._started        = False
+        self._pending        = 0
+        self._last_flush     = time.monotonic()
+
+    def write(self, text):
+        """
+
+        Buffer a chunk, flushing once enough chunks or time have accumulated. Empty chunks
+        still run the time check, so visible text is not stranded while the stream only
+        carries tool-call deltas or held-back reasoning.
+        """
+        if text:
+            if not self._started:
+                self._write(self._prefix)
+                self._started = True
+
+            self._write(text)
+            self._pending += 1
+
+        if not self._pending:
+            return
+
+        now = time.monotonic()
+        if self._pending >= self._flush_every or now - self._last_flush >= self._flush_interval:
+            sys.stdout.flush()
+            self._pending    = 0
+            self._last_flush = now
+
+    def close(self):
+        """
+
+        Terminate the echoed reply, if any, and flush whatever is still buffered
+        """
+        if self._started:
+            self._write("\n")
+        sys.stdout.flush()
+
+
+#################### History Limits ####################
+
+MAX_HISTORY_TOKENS = 8192
+KEEP_TAIL          = 8
+TAIL_TOKEN_SHARE   = 0.5
+SUMMARY_LINE_CHARS = 200
+
+
+#################### Tool Output Cleanup ####################
+
+TOOL_OUTPUT_HEAD = 8192
+TOOL_OUTPUT_TAIL = 2048
+
+_ANSI_RE        = re.compile(r'\x1b\[[0-9;]*m')
+_TRAILING_WS_RE = re.compile(r'[ \t]+$', re.MULTILINE)
+
+
+def clean_tool_output(text):
+    """
+
+    Strip color codes and trailing blanks, then keep only the head and tail of long output
+    """
+    text = _TRAILING_WS_RE.sub('', _ANSI_RE.sub('', text))
+
+    if len(text) > TOOL_OUTPUT_HEAD + TOOL_OUTPUT_TAIL:
+        dropped = len(text) - TOOL_OUTPUT_HEAD - TOOL_OUTPUT_TAIL
+        text    = f"{text[:TOOL_OUTPUT_HEAD]}\n…[{dropped} characters truncated]…\n{text[-TOOL_OUTPUT_TAIL:]}"
+
+    return text
+
+
+def _serialize_dict(result):
+    """
+
+    Clean a structured tool result's stdout and stderr, then encode it as JSON
+    """
+    for key in ("stdout", "stderr"):
+        if result.get(key):
+            result = {**result, key: clean_tool_output(result[key])}
+    return dumps(result)
+
+
+_SERIALIZE = {
+    dict:  _serialize_dict,
+    str:   clean_tool_output,
+    bytes: lambda result: clean_tool_output(result.decode("utf-8", "replace")),
+}
+
+
+def _serialize_other(result):
+    """
+
+    Fallback for tool results of any other type
+    """
+    return clean_tool_output(str(result))
+
+
+def estimate_tokens(message):
+    """
+
+    Cheap token estimate for a message, assuming ~4 characters per token
+    """
+    chars = len(message.get("content") or "")
+    for tc in message.get("tool_calls", ()):
+        chars += len(tc["function"]["arguments"])
+    return chars // 4
+
+
 #################### Messages Class ####################
 
 class Messages:
     """
 
     Manages conversation history for the agent
+
+    History is append-only until it outgrows max_history_tokens (or max_messages, if
+    set), so each request repeats the previous one as a prefix and servers with prefix
+    caching only prefill the new tail. Past the cap, older turns are folded into a summary.
+
+    max_messages is a soft bound: an assistant message is never split from its tool replies,
+    so while one tool group alone overfills the tail the history holds that group whole.
     """
 
-    def __init__(self, system_prompt):
-        self._messages = [{"role": "system", "content": system_prompt}]
+    def __init__(self, system_prompt, max_history_tokens=MAX_HISTORY_TOKENS, keep_tail=KEEP_TAIL,
+                 max_messages=None):
+        if max_messages is not None:
+            if max_messages < 3:
+                raise ValueError("max_messages must leave room for the system prompt, a summary and one message")
+            # The system prompt and the summary count against the cap, so the tail must fit in the rest
+            keep_tail = min(keep_tail, max_messages - 2)
+
+        self._messages           = [{"role": "system", "content": system_prompt}]
+        self._max_history_tokens = max_history_tokens
+        self._max_messages       = max_messages
+        self._keep_tail          = keep_tail
+        self._token_estimate     = estimate_tokens(self._messages[0])
+        self._json_prefix        = None
 
     def add_user_message(self, content):
         """
 
         Add a user message to the conversation
         """
-        self._messages.append({"role": "user", "content": content})
+        self._append({"role": "user", "content": content})
 
     def add_assistant_message(self, content, tool_calls=None):
         """
 
-        Add an assistant message to the conversation
+        Add an assistant message to the conversation, omitting empty content on tool-call-only turns
         """
-        message = {"role": "assistant", "content": content}
-
-        if tool_calls:
-            message["tool_calls"] = [
+        if not tool_calls:
+            self._append({"role": "assistant", "content": content})
+            return
+
+        self._append({
+            "role":       "assistant",
+            **({"content": content} if content else {}),
+            "tool_calls": [
                 {
                     "id":       tc.id,
                     "type":     "function",
                     "function": {
-                        "name":      tc.function.name,
-                        "arguments": tc.function.arguments
+                        "name":      (fn := tc.function).name,
+                        "arguments": fn.arguments
                     }
                 }
                 for tc in tool_calls
             ]
-
-        self._messages.append(message)
+        })
 
     def add_tool_message(self, result, tool_call_id):
         """
 
         Add a tool response message to the conversation
         """
-        content = js.dumps(result) if isinstance(result, dict) else str(result)
-        self._messages.append({
+        self._append({
             "role":         "tool",
-            "content":      content,
+            "content":      _SERIALIZE.get(type(result), _serialize_other)(result),
             "tool_call_id": tool_call_id
         })
 
     def get_messages(self):
         """
 
-        Return the full message history
+        Return a shallow copy of the message history, so callers cannot mutate it
+        """
+        return list(self._messages)
+
+    def get_messages_json(self):
+        """
+
+        Return the history as JSON bytes. The serialized prefix is built on first use and then
+        extended per append, so callers that never ask for it do not pay for it.
+        """
+        if self._json_prefix is None:
+            self._json_prefix = bytearray(b"[" + b",".join(dumps_bytes(m) for m in self._messages))
+
+        return bytes(self._json_prefix) + b"]"
+
+    def _append(self, message):
+        """
+
+        Append a message and compact the history if it grew past the cap
+        """
+        self._messages.append(message)
+        self._token_estimate += estimate_tokens(message)
+
+        if self._json_prefix is not None:
+            self._json_prefix += b"," + dumps_bytes(message)
+
+        over_tokens   = self._token_estimate > self._max_history_tokens
+        over_messages = self._max_messages is not None and len(self._messages) > self._max_messages
+
+        if over_tokens or over_messages:
+            self._compact()
+
+    def _compact(self):
+        """
+
+        Replace everything between the system prompt and the last few turns with a summary
+        """
+        # A previous summary sits right after the system prompt, and cutting just past it gains nothing
+        start = 2 if self._messages[1]["role"] == "system" else 1
+        limit = len(self._messages) - 1
+
+        if limit <= start:
+            return
+
+        # Grow the tail while it fits in keep_tail messages and a share of the token cap, so the
+        # history lands well under the cap and the summary is not rewritten on every append
+        budget = self._max_history_tokens * TAIL_TOKEN_SHARE
+        tokens = estimate_tokens(self._messages[limit])
+
+        while limit - 1 > start and len(self._messages) - limit < self._keep_tail:
+            tokens += estimate_tokens(self._messages[limit - 1])
+            if tokens > budget:
+                break
+            limit -= 1
+
+        # Cut at a turn boundary so tool replies stay with their call; a tool group too big for
+        # the tail is kept whole
+        cut = self._first_boundary_from(limit) or self._last_role_before(limit, "assistant", start)
+
+        if cut is None:
+            return
+
+        summary = {"role": "system", "content": self._summarize(self._messages[1:cut])}
+
+        self._messages[1:cut] = [summary]
+        self._token_estimate  = sum(estimate_tokens(m) for m in self._messages)
+        self._json_prefix     = None
+
+    def _first_boundary_from(self, limit):
+        """
+
+        Index of the first user or assistant message at or after limit, or None
+        """
+        for i in range(limit, len(self._messages)):
+            if self._messages[i]["role"] in ("user", "assistant"):
+                return i
+        return None
+
+    def _last_role_before(self, limit, role, start):
+        """
+
+        Index of the last message with the given role in (start, limit], or None
+        """
+        for i in range(limit, start, -1):
+            if self._messages[i]["role"] == role:
+                return i
+        return None
+
+    def _summarize(self, old_messages):
+        """
+
+        Deterministically condense old messages into requests, commands and replies
         """
-        return self._messages
+        lines = ["Summary of the earlier conversation:"]
+
+        for message in old_messages:
+            role    = message["role"]
+            content = (message.get("content") or "").strip()
+
+            if role == "system":
+                lines.extend(content.splitlines()[1:])
+            elif role == "user":
+                lines.append(f"- User asked: {content[:SUMMARY_LINE_CHARS]}")
+            elif role == "assistant":
+                for tc in message.get("tool_calls", ()):
+                    lines.append(f"- Assistant called {tc['function']['name']}: {tc['function']['arguments'][:SUMMARY_LINE_CHARS]}")
+                if content:
+                    lines.append(f"- Assistant replied: {content[:SUMMARY_LINE_CHARS]}")
+
+        # Keep the newest lines within ~a quarter of the token cap so summaries stay bounded
+        budget = self._max_history_tokens
+        kept   = []
+        for line in reversed(lines[1:]):
+            budget -= len(line) + 1
+            if budget < 0:
+                break
+            kept.append(line)
+
+        return "\n".join(lines[:1] + kept[::-1])
 
     def __len__(self):
         return len(self._messages)
 
 
+#################### Stream Accumulator Class ####################
+
+class StreamAccumulator:
+    """
+
+    Rebuilds a streamed reply's content and tool calls from chunk deltas, optionally echoing visible text
+    """
+
+    def __init__(self, echo_prefix=None):
+        self._content_buf     = []
+        self._tool_call_accum = {}
+        self._think_filter    = ThinkFilter()
+        self._echo            = StreamEcho(echo_prefix) if echo_prefix is not None else None
+
+    def add(self, chunk):
+        """
+
+        Fold one ChatCompletionChunk into the reply and return its visible text
+        """
+        if not chunk.choices:
+            return ""
+
+        delta   = chunk.choices[0].delta
+        visible = ""
+
+        if delta.content:
+            self._content_buf.append(delta.content)
+            visible = self._think_filter.feed(delta.content)
+
+        # Written even when empty, so the echo's time-based flush keeps running
+        if self._echo:
+            self._echo.write(visible)
+
+        for tc in delta.tool_calls or ():
+            entry = self._tool_call_accum.setdefault(tc.index, {"id": "", "name": "", "arguments": ""})
+            if tc.id:
+                entry["id"] = tc.id
+            if tc.function:
+                entry["name"]      += tc.function.name or ""
+                entry["arguments"] += tc.function.arguments or ""
+
+        return visible
+
+    def flush(self):
+        """
+
+        Return the visible text held back until the stream ended, closing the echo
+        """
+        if self._think_filter is None:
+            return ""
+
+        tail, self._think_filter = self._think_filter.flush(), None
+
+        if self._echo:
+            self._echo.write(tail)
+            self._echo.close()
+
+        return tail
+
+    def finish(self):
+        """
+
+        Flush the stream and return the full content and materialized tool calls
+        """
+        self.flush()
+
+        tool_calls = [
+            ToolCall(entry["id"], Function(entry["name"], entry["arguments"]))
+            for _, entry in sorted(self._tool_call_accum.items())
+        ]
+
+        return "".join(self._content_buf), tool_calls or None
+
+
 #################### LLM Class ####################
 
 class LLM:
     """
 
-    Wrapper for OpenAI-compatible LLM API interactions
+    Wrapper for OpenAI-compatible LLM API interactions, with sync and async clients
     """
 
-    def __init__(self, base_url, api_key, model, temperature=0.6, top_p=0.95, max_tokens=4096):
-        self.client      = oai.OpenAI(base_url=base_url, api_key=api_key)
+    ECHO_PREFIX = "\n[🤖] "
+
+    def __init__(self, base_url, api_key, model, temperature=0.6, top_p=0.95, max_tokens=4096, max_concurrency=4,
+                 cache=False, cache_size=512):
+        self.client      = oai.OpenAI(base_url=base_url, api_key=api_key, http_client=_get_http_client())
+        self.aclient     = oai.AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=_get_async_http_client())
         self.model       = model
         self.temperature = temperature
         self.top_p       = top_p
         self.max_tokens  = max_tokens
+        self.cache       = cache
+        self._semaphore  = aio.Semaphore(max_concurrency)
+        self._cache      = cl.OrderedDict()
+        self._cache_size = cache_size
 
     def query(self, messages, tools=None):
         """
 
-        Send a query to the LLM and get a response
+        Stream a query to the LLM, echoing visible content as it arrives
         """
-        kwargs = {
+        echo   = StreamEcho(self.ECHO_PREFIX)
+        stream = self.query_stream(messages, tools)
+
+        try:
+            while True:
+                echo.write(next(stream))
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            echo.close()
+
+    def query_stream(self, messages, tools=None):
+        """
+
+        Generator over the visible text of a streamed reply, returning (content, tool_calls) when done
+        """
+        key = self._cache_key(messages, tools)
+        hit = self._cache_get(key)
+        if hit is not None:
+            think_filter = ThinkFilter()
+            text         = think_filter.feed(hit[0]) + think_filter.flush()
+            if text:
+                yield text
+            return hit
+
+        accumulator = StreamAccumulator()
+
+        for chunk in self.client.chat.completions.create(**self._request_kwargs(messages, tools, stream=True)):
+            text = accumulator.add(chunk)
+            if text:
+                yield text
+
+        tail = accumulator.flush()
+        if tail:
+            yield tail
+
+        return self._cache_put(key, accumulator.finish())
+
+    async def aquery(self, messages, tools=None):
+        """
+
+        Async counterpart of query, streaming without blocking the event loop
+        """
+        key = self._cache_key(messages, tools)
+        hit = self._cache_get(key)
+        if hit is not None:
+            return self._replay(hit)
+
+        accumulator = StreamAccumulator(self.ECHO_PREFIX)
+
+        async for chunk in await self.aclient.chat.completions.create(**self._request_kwargs(messages, tools, stream=True)):
+            accumulator.add(chunk)
+
+        return self._cache_put(key, accumulator.finish())
+
+    async def aquery_many(self, batch, tools=None):
+        """
+
+        Send independent conversations concurrently, without echoing, capped by max_concurrency
+        """
+        async def complete(messages):
+            key = self._cache_key(messages, tools)
+            hit = self._cache_get(key)
+            if hit is not None:
+                return hit
+
+            async with self._semaphore:
+                raw = await self.aclient.chat.completions.with_raw_response.create(**self._request_kwargs(messages, tools))
+
+            # Parse the body directly instead of validating it into SDK models
+            message    = loads(raw.content)["choices"][0]["message"]
+            content    = message.get("content") or ""
+            tool_calls = [
+                ToolCall(tc["id"], Function((fn := tc["function"])["name"], fn["arguments"]))
+                for tc in message.get("tool_calls") or ()
+            ] or None
+
+            return self._cache_put(key, (content, tool_calls))
+
+        return await aio.gather(*(complete(messages) for messages in batch))
+
+    def _cache_key(self, messages, tools):
+        """
+
+        Hash everything that determines a reply, or None when replies are not cacheable
+        """
+        if not (self.cache or self.temperature == 0):
+            return None
+
+        params = {
             "model":       self.model,
-            "messages":    messages.get_messages(),
+            "tools":       tools,
             "temperature": self.temperature,
             "top_p":       self.top_p,
             "max_tokens":  self.max_tokens,
         }
+        digest = hl.sha256(messages.get_messages_json())
+        digest.update(dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
 
-        if tools:
-            kwargs["tools"]       = tools
-            kwargs["tool_choice"] = "auto"
+    def _cache_get(self, key):
+        """
+
+        Look up a cached reply, marking it most recently used
+        """
+        if key is None or key not in self._cache:
+            return None
 
-        response   = self.client.chat.completions.create(**kwargs)
-        message    = response.choices[0].message
-        content    = message.content or ""
-        tool_calls = message.tool_calls if hasattr(message, 'tool_calls') else None
+        self._cache.move_to_end(key)
+        return self._cache[key]
 
-        return content, tool_calls
+    def _cache_put(self, key, reply):
+        """
+
+        Store a reply, evicting the least recently used one past cache_size, and return it
+        """
+        if key is not None:
+            self._cache[key] = reply
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        return reply
 
-    def strip_thinking(self, response):
+    def _replay(self, reply):
         """
 
-        Remove thinking tags from the response
+        Echo a cached reply the same way a streamed one would have been shown
+        """
+        think_filter = ThinkFilter()
+        echo         = StreamEcho(self.ECHO_PREFIX)
+
+        echo.write(think_filter.feed(reply[0]))
+        echo.write(think_filter.flush())
+        echo.close()
+
+        return reply
+
+    def _request_kwargs(self, messages, tools=None, stream=False):
         """
-        if "</think>" in response:
-            return response.split("</think>")[-1].strip()
-        return response
\ No newline at end of file
+
+        Build the chat completion arguments shared by every query path
+        """
+        kwargs = {
+            "model":       self.model,
+            "messages":    messages.get_messages(),
+            "temperature": self.temperature,
+            "top_p":       self.top_p,
+            "max_tokens":  self.max_tokens,
+        }
+
+        if stream:
+            kwargs["stream"]         = True
+            kwargs["stream_options"] = {"include_usage": False}
+
+        if tools:
+            kwargs["tools"]       = tools
+            kwargs["tool_choice"] = "auto"
+
+        return kwargs
@@ -1,91 +1,111 @@
 #!/usr/bin/env python3
 
 import os
-import pathlib as pl
+import asyncio as aio
 
+import pydantic as pd
 import langgraph.prebuilt as lgp
 import langgraph.checkpoint.memory as lgm
 import langchain_openai as lco
+import langchain_core.tools as lct
+import langchain_core.messages as lcm
 
 import lib.bash_tool as bt
 import lib.llm_helpers as lh
+import lib.agent_common as ac
 
 
 #################### System Prompt ####################
 
-SYSTEM_PROMPT = f"""/think
-You are a helpful Bash assistant with the ability to execute commands in the shell.
-You engage with users to help answer questions about bash commands, or execute their intent.
-If user intent is unclear, keep engaging with them to figure out what they need and how to best help
-them. If they ask question that are not relevant to bash or computer use, decline to answer.
+SYSTEM_PROMPT  = ac.make_system_prompt(bt.LIST_OF_ALLOWED_COMMANDS, think=True)
+SYSTEM_MESSAGE = lcm.SystemMessage(content=SYSTEM_PROMPT)
 
-When a command is executed, you will be given the output from that command and any errors. Based on
-that, either take further actions or yield control to the user.
 
-The bash interpreter's output and current working directory will be given to you every time a
-command is executed. Take that into account for the next conversation.
-If there was an error during execution, tell the user what that error was exactly.
+#################### Chat Model ####################
 
-You are only allowed to execute the following commands:
-{', '.join(bt.LIST_OF_ALLOWED_COMMANDS)}
+_LLM        = None
+_LLM_CONFIG = None
 
-**Never** attempt to execute a command not in this list. **Never** attempt to execute dangerous commands
-like `rm`, `mv`, `rmdir`, `sudo`, etc. If the user asks you to do so, politely refuse.
 
-When you switch to new directories, always list files so you can get more context.
-"""
+def _get_llm(model, base_url, api_key):
+    """
 
+    Return the shared ChatOpenAI client, building it only on first use or when the configuration changes
+    """
+    global _LLM, _LLM_CONFIG
+    if _LLM is None or _LLM_CONFIG != (model, base_url, api_key):
+        _LLM        = lco.ChatOpenAI(
+            model=model,
+            base_url=base_url,
+            api_key=api_key,
+            temperature=0.6,
+            top_p=0.95,
+            max_tokens=4096,
+        )
+        _LLM_CONFIG = (model, base_url, api_key)
+    return _LLM
 
-#################### Execution Wrapper Class ####################
 
-class ExecOnConfirm:
-    """
+#################### Tool Definition ####################
 
-    A wrapper around Bash class to implement human-in-the-loop confirmation
+class _ExecArgs(pd.BaseModel):
     """
 
-    def __init__(self, bash):
-        self.bash = bash
-
-    def _confirm_execution(self, cmd):
-        """
+    Arguments schema for the bash execution tool
+    """
 
-        Ask the user whether the suggested command should be executed
-        """
-        if self.bash.is_auto_executable(cmd):
-            print(f"    ⚡  Auto-executing '{cmd}'")
-            return True
+    cmd: str = pd.Field(description="The bash command to execute")
 
-        return input(f"    ▶️   Execute '{cmd}'? [y/N]: ").strip().lower() == "y"
 
-    def exec_bash_command(self, cmd):
-        """
+def make_exec_tool(bash):
+    """
 
-        Execute a bash command after confirming with the user
-        """
-        if self._confirm_execution(cmd):
-            return self.bash.exec_bash_command(cmd)
-        return {"error": "The user declined the execution of this command"}
+    Wrap the confirming executor in a StructuredTool whose schema is built once, up front
+    """
+    return lct.StructuredTool.from_function(
+        ac.ExecOnConfirm(bash).exec_bash_command,
+        name="exec_bash_command",
+        description="Execute a bash command after user confirmation",
+        args_schema=_ExecArgs,
+    )
 
 
 #################### Helper Functions ####################
 
-def get_prompt_prefix(cwd):
+async def stream_reply(agent, user_input, config, think_preopened=False):
     """
 
-    Generate a prompt prefix showing the current working directory
+    Stream the agent's replies for one user turn, hiding reasoning as it arrives. The echo is
+    closed before any tool runs, so confirmation prompts never land inside a half-printed reply.
     """
-    return f"['{cwd}' 🙂] "
+    echo, think_filter, message_id = None, None, None
 
+    def close_echo():
+        nonlocal echo
+        if echo:
+            echo.write(think_filter.flush())
+            echo.close()
+            echo = None
 
-def strip_thinking(response):
-    """
+    async for chunk, _ in agent.astream(
+        {"messages": [{"role": "user", "content": user_input}]},
+        config=config,
+        stream_mode="messages"
+    ):
+        if not isinstance(chunk, lcm.AIMessageChunk) or chunk.tool_call_chunks or chunk.id != message_id:
+            close_echo()
 
-    Remove thinking tags from the response
-    """
-    if "</think>" in response:
-        return response.split("</think>")[-1].strip()
-    return response
+        if not isinstance(chunk, lcm.AIMessageChunk) or not isinstance(chunk.content, str) or not chunk.content:
+            continue
+
+        if echo is None:
+            echo         = lh.StreamEcho("\n[🤖] ")
+            think_filter = lh.ThinkFilter(starts_in_think=think_preopened)
+            message_id   = chunk.id
+
+        echo.write(think_filter.feed(chunk.content))
+
+    close_echo()
 
 
 def get_api_key():
@@ -126,7 +146,7 @@ def print_banner(model, start_dir, auto_count, allowed_count):
 
 #################### Main Entry Point ####################
 
-def main():
+async def main():
     """
 
     Main entry point for the LangGraph-based bash agent
@@ -139,7 +159,7 @@ def main():
         print("Exiting...")
         return
 
-    start_dir = str(pl.Path.home())
+    start_dir = ac.HOME_DIR
 
     bash = bt.Bash(
         cwd=start_dir,
@@ -148,16 +168,9 @@ def main():
     )
 
     agent = lgp.create_react_agent(
-        model=lco.ChatOpenAI(
-            model=model,
-            base_url=base_url,
-            api_key=api_key,
-            temperature=0.6,
-            top_p=0.95,
-            max_tokens=4096,
-        ),
-        tools=[ExecOnConfirm(bash).exec_bash_command],
-        prompt=SYSTEM_PROMPT,
+        model=_get_llm(model, base_url, api_key),
+        tools=[make_exec_tool(bash)],
+        prompt=SYSTEM_MESSAGE,
         checkpointer=lgm.InMemorySaver(),
     )
 
@@ -170,36 +183,33 @@ def main():
         len(bt.LIST_OF_ALLOWED_COMMANDS)
     )
 
-    while True:
-        try:
-            user_input = input(get_prompt_prefix(bash.cwd)).strip()
+    try:
+        while True:
+            try:
+                user_input = (await ac.read_input(ac.get_prompt_prefix(bash.cwd))).strip()
 
-            if user_input.lower() in ['exit', 'quit', 'q']:
-                print("\n👋 Goodbye!")
-                break
+                if user_input.lower() in ['exit', 'quit', 'q']:
+                    print("\n👋 Goodbye!")
+                    break
 
-            if not user_input:
-                continue
+                if not user_input:
+                    continue
 
-            result   = agent.invoke(
-                {"messages": [{"role": "user", "content": user_input}]},
-                config=config
-            )
+                await stream_reply(agent, user_input, config, model in lh.THINK_PREOPENED_MODELS)
+                print()
 
-            response = result["messages"][-1].content.strip()
-            response = strip_thinking(response)
-
-            if response:
-                print(f"\n[🤖] {response}")
-            print()
-
-        except KeyboardInterrupt:
-            print("\n\n👋 Session interrupted. Goodbye!")
-            break
-        except Exception as e:
-            print(f"\n❌ Error: {e}")
-            print("   Please try again\n")
+            except (KeyboardInterrupt, aio.CancelledError):
+                print("\n\n👋 Session interrupted. Goodbye!")
+                break
+            except Exception as e:
+                print(f"\n❌ Error: {e}")
+                print("   Please try again\n")
+    finally:
+        bash.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        aio.run(main())
+    except KeyboardInterrupt:
+        pass
\ No newline at end of file
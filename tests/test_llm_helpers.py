@@ -0,0 +1,123 @@
+import lib.llm_helpers as lh
+
+
+#################### Think Filter ####################
+
+def feed_in_pieces(think_filter, text, size):
+    """
+
+    Feed text to the filter in fixed-size pieces and collect everything it lets through
+    """
+    out = [think_filter.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    return "".join(out) + think_filter.flush()
+
+
+def test_think_filter_drops_reasoning_before_bare_close_tag():
+    for size in (1, 2, 3, 5, 64):
+        assert feed_in_pieces(lh.ThinkFilter(), "reasoning</think>answer", size) == "answer"
+
+
+def test_think_filter_hides_explicit_think_block():
+    for size in (1, 4, 64):
+        assert feed_in_pieces(lh.ThinkFilter(), "<think>hmm</think>\nanswer", size) == "answer"
+
+
+def test_think_filter_releases_held_text_without_tags():
+    assert feed_in_pieces(lh.ThinkFilter(), "plain answer", 3) == "plain answer"
+
+
+#################### Messages Compaction ####################
+
+TOOL_CALL = [lh.ToolCall("c1", lh.Function("exec_bash_command", '{"cmd": "cat big.log"}'))]
+
+
+def add_tool_round(messages, output):
+    messages.add_assistant_message("", TOOL_CALL)
+    messages.add_tool_message({"stdout": output, "stderr": "", "cwd": "/"}, "c1")
+
+
+def estimate_history(messages):
+    return sum(lh.estimate_tokens(m) for m in messages.get_messages())
+
+
+def test_compaction_leaves_room_so_summary_prefix_stays_stable():
+    messages = lh.Messages("system", max_history_tokens=1000)
+    messages.add_user_message("read the logs")
+
+    while messages.get_messages()[1]["role"] != "system":
+        add_tool_round(messages, "x" * 1200)
+
+    summary = messages.get_messages()[1]
+    for _ in range(2):
+        add_tool_round(messages, "x" * 400)
+
+    assert messages.get_messages()[1] is summary
+    assert estimate_history(messages) <= 1000
+
+
+def test_compaction_cuts_inside_a_long_tool_loop():
+    messages = lh.Messages("system", max_history_tokens=200)
+    messages.add_user_message("loop")
+
+    for _ in range(50):
+        add_tool_round(messages, "x" * 100)
+
+    assert len(messages) <= 2 + lh.KEEP_TAIL
+    assert messages.get_messages()[2]["role"] == "assistant"
+
+
+#################### Stream Echo ####################
+
+def test_stream_echo_flushes_on_empty_writes_after_interval(monkeypatch):
+    clock   = [0.0]
+    flushes = []
+    monkeypatch.setattr(lh.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(lh.sys.stdout, "flush", lambda: flushes.append(clock[0]))
+
+    echo = lh.StreamEcho("> ", flush_every=32, flush_interval=0.05)
+    echo.write("visible")
+    assert not flushes
+
+    clock[0] = 1.0
+    echo.write("")
+    assert flushes == [1.0]
+
+
+#################### Messages Count Cap ####################
+
+def test_max_messages_is_soft_by_one_tool_group():
+    tool_calls = [lh.ToolCall(f"c{i}", lh.Function("exec_bash_command", "{}")) for i in range(3)]
+    messages   = lh.Messages("system", max_messages=5)
+
+    messages.add_user_message("run three things")
+    messages.add_assistant_message("", tool_calls)
+    for tc in tool_calls:
+        messages.add_tool_message("ok", tc.id)
+
+    # System prompt, summary, and the assistant message with all three tool replies kept together
+    assert len(messages) == 2 + 1 + len(tool_calls)
+    assert [m["role"] for m in messages.get_messages()[2:]] == ["assistant", "tool", "tool", "tool"]
+
+    messages.add_assistant_message("done")
+    assert len(messages) <= 5
+
+
+def test_max_messages_holds_for_plain_turns():
+    messages = lh.Messages("system", max_messages=5)
+    for _ in range(20):
+        messages.add_user_message("question")
+        messages.add_assistant_message("answer")
+        assert len(messages) <= 5
+
+
+#################### Reply Cache ####################
+
+def test_cache_key_changes_with_max_tokens():
+    llm      = lh.LLM("http://127.0.0.1:1/v1", "key", "model", temperature=0, max_tokens=16)
+    messages = lh.Messages("system")
+    messages.add_user_message("hello")
+
+    short_key      = llm._cache_key(messages, None)
+    llm.max_tokens = 4096
+
+    assert llm._cache_key(messages, None) != short_key